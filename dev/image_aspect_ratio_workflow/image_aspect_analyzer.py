@@ -5,22 +5,383 @@ S3から画像を取得してアスペクト比を分析し、2:3を基準に分
 """
 
 import json
+import logging
 import re
 import math
 import sys
 import os
+import threading
+import functools
+from collections import OrderedDict
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Callable, Iterable, Iterator, Optional, Tuple, Union, cast
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from PIL import Image
 import io
+import struct
 import argparse
+import bisect
+
+
+logger = logging.getLogger(__name__)
+
+# Range GET で取得するヘッダーのバイト数
+HEADER_RANGE_BYTES = 64 * 1024  # 64KB
+HEADER_MAX_RANGE_BYTES = 512 * 1024  # 512KB（ヘッダーが見つからない場合に読み込む上限、EXIFが大きいJPEG向け）
+STREAM_CHUNK_BYTES = 8 * 1024  # ストリーミング解析の読み込み単位
+STREAM_DRAIN_BYTES = 64 * 1024  # 残りがこれ以下なら読み切って接続を再利用する
+
+# 一括分析時の同時リクエスト数
+BATCH_MAX_WORKERS = 64
+
+# ファイル名・ファイルサイズ解析用の正規表現（モジュール読み込み時にコンパイル）
+_DIM_RE = re.compile(r'(\d+)x(\d+)', re.IGNORECASE)
+_SIZE_RE = re.compile(r'([\d.]+)\s*(MB|KB|B)', re.IGNORECASE)
+_SIZE_UNITS = {'MB': 1024 * 1024, 'KB': 1024}
+
+# 縦長判定の基準（2:3）
+THRESHOLD_2_3 = 2 / 3  # 0.6667
+
+# 分類結果・検出方法（全ての結果で同じ文字列オブジェクトを共有）
+_CLASS_TALL = sys.intern('tall')
+_CLASS_NOT_TALL = sys.intern('not_tall')
+_CLASS_UNKNOWN = sys.intern('unknown')
+_CLASS_ERROR = sys.intern('error')
+
+_DET_UNKNOWN = sys.intern('unknown')
+_DET_EXPLICIT = sys.intern('explicit')
+_DET_BINARY = sys.intern('binary_analysis')
+_DET_FILENAME = sys.intern('filename_pattern')
+_DET_FILESIZE = sys.intern('filesize_estimation')
+_DET_DEFAULT = sys.intern('default')
+
+# 推奨アクション（キーで保持し、出力時にのみ文字列に展開する）
+_RECS = {
+    'tall': 'ポートレート写真、モバイル向け画像、縦型バナーとして使用',
+    'portrait': 'ポートレート写真や縦型コンテンツに適用',
+    'square': 'プロフィール画像、アイコン、正方形コンテンツに適用',
+    'wide': 'バナー画像、ヘッダー画像、横型コンテンツに適用',
+}
+
+# 詳細分類: (詳細分類, 推奨アクションのキー)
+_DETAIL_TALL = ('縦長（2:3より縦長）', 'tall')
+_DETAIL_PORTRAIT = ('2:3から3:4の範囲', 'portrait')
+_DETAIL_SQUARE = ('正方形に近い', 'square')
+_DETAIL_WIDE = ('横長', 'wide')
+
+# 詳細分類の境界値（昇順）と、各区間に対応する詳細分類
+_THRESHOLDS = (0.67, 0.8, 1.2)
+_BUCKETS = (_DETAIL_TALL, _DETAIL_PORTRAIT, _DETAIL_SQUARE, _DETAIL_WIDE)
+
+# キーワードベース推測の分類（優先順）: (ラベル, キーワード, デフォルト寸法)
+_KEYWORD_BUCKETS = (
+    ('wide', ('banner', 'header', 'landscape', 'wide'), (1920, 1080)),  # 横長デフォルト
+    ('tall', ('portrait', 'mobile', 'vertical', 'tall'), (1080, 1920)),  # 縦長デフォルト
+    ('square', ('square', 'icon', 'profile', 'avatar'), (500, 500)),  # 正方形デフォルト
+)
+# キーワード → (優先度, ラベル, デフォルト寸法)
+_KW_MAP = {
+    keyword: (priority, label, dimensions)
+    for priority, (label, keywords, dimensions) in enumerate(_KEYWORD_BUCKETS)
+    for keyword in keywords
+}
+# 先読みで全ての開始位置を調べる（verticalandscape の landscape のように重なるキーワードも検出）
+_KW_RE = re.compile('(?=(%s))' % '|'.join(_KW_MAP), re.IGNORECASE)
+
+# S3キーの拡張子判定（Pillow が対応する画像の拡張子 / 最後のパス要素の任意の拡張子）
+# .jfif, .jpe, .avif, .apng, .ico なども含めるため、Pillow に登録済みの拡張子から生成する
+_IMAGE_EXTENSIONS = sorted({ext.lower() for ext in Image.registered_extensions()}, key=len, reverse=True)
+_IMG_KEY_RE = re.compile(r'(?:%s)(?:\?|$)' % '|'.join(map(re.escape, _IMAGE_EXTENSIONS)), re.IGNORECASE)
+_KEY_EXT_RE = re.compile(r'\.[^./]+$')
+
+
+def _looks_like_image(file_key: str) -> bool:
+    """
+    S3キーが画像を指している可能性があるかを判定（S3へのリクエスト前の事前チェック）
+    
+    拡張子のないキーは判定できないため画像として扱い、
+    画像以外の拡張子を持つキーのみを除外する。
+    """
+    if _IMG_KEY_RE.search(file_key):
+        return True
+    return _KEY_EXT_RE.search(file_key) is None
+
+
+# 寸法キャッシュ: (バケット名, キー) → (ETag, (width, height))
+DIMENSIONS_CACHE_SIZE = 10000
+_dimensions_cache: 'OrderedDict[Tuple[str, str], Tuple[str, Tuple[int, int]]]' = OrderedDict()
+_dimensions_cache_lock = threading.Lock()
+
+
+def _get_cached_dimensions(bucket_name: str, file_key: str) -> Optional[Tuple[str, Tuple[int, int]]]:
+    """キャッシュ済みの (ETag, 寸法) を取得（LRU順を更新）"""
+    with _dimensions_cache_lock:
+        entry = _dimensions_cache.get((bucket_name, file_key))
+        if entry is not None:
+            _dimensions_cache.move_to_end((bucket_name, file_key))
+        return entry
+
+
+def _set_cached_dimensions(bucket_name: str, file_key: str, etag: str, dimensions: Tuple[int, int]) -> None:
+    """ETag と寸法をキャッシュに保存（上限を超えた場合は最も古いエントリを削除）"""
+    with _dimensions_cache_lock:
+        _dimensions_cache[(bucket_name, file_key)] = (etag, dimensions)
+        _dimensions_cache.move_to_end((bucket_name, file_key))
+        if len(_dimensions_cache) > DIMENSIONS_CACHE_SIZE:
+            _dimensions_cache.popitem(last=False)
+
+
+# サイズ情報を持つ JPEG SOF マーカー（DHT / JPG / DAC は除外）
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# 長さフィールドを持たない JPEG マーカー（SOI, TEM, RST0-7）
+_JPEG_STANDALONE_MARKERS = frozenset([0xD8, 0x01, *range(0xD0, 0xD8)])
+
+
+def _parse_jpeg_dims(data: Union[bytes, bytearray]) -> Optional[Tuple[int, int]]:
+    """JPEG のセグメントを走査して SOF マーカーから寸法を取得"""
+    i = 2
+    length = len(data)
+    while i + 9 <= length:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # フィルバイト
+            i += 1
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            i += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack_from('>HH', data, i + 5)
+            return width, height
+        if marker in (0xD9, 0xDA):  # EOI / SOS 以降に SOF は現れない
+            return None
+        i += 2 + struct.unpack_from('>H', data, i + 2)[0]
+    return None
+
+
+def _parse_webp_dims(data: Union[bytes, bytearray]) -> Optional[Tuple[int, int]]:
+    """WebP の RIFF チャンク（VP8 / VP8L / VP8X）から寸法を取得"""
+    chunk = data[12:16]
+    if chunk == b'VP8 ' and len(data) >= 30 and data[23:26] == b'\x9d\x01\x2a':
+        width, height = struct.unpack_from('<HH', data, 26)
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(data) >= 25 and data[20] == 0x2F:
+        bits = struct.unpack_from('<I', data, 21)[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X' and len(data) >= 30:
+        width = int.from_bytes(data[24:27], 'little') + 1
+        height = int.from_bytes(data[27:30], 'little') + 1
+        return width, height
+    return None
+
+
+def _image_format(data: Union[bytes, bytearray]) -> Optional[str]:
+    """先頭のマジックバイトから画像形式を判定（_parse_dims が対応する形式のみ）"""
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if data[:2] == b'\xff\xd8':
+        return 'jpeg'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def _parse_dims(data: Union[bytes, bytearray]) -> Optional[Tuple[int, int]]:
+    """
+    画像ヘッダーを直接解析して寸法を取得（JPEG / PNG / GIF / WebP）
+    
+    Args:
+        data: 画像先頭のバイナリデータ
+        
+    Returns:
+        (width, height) のタプル、未対応形式またはヘッダー不足の場合はNone
+    """
+    image_format = _image_format(data)
+    if image_format == 'png':
+        if len(data) >= 24 and data[12:16] == b'IHDR':
+            return struct.unpack_from('>II', data, 16)
+        return None
+    if image_format == 'jpeg':
+        return _parse_jpeg_dims(data)
+    if image_format == 'gif':
+        if len(data) >= 10:
+            return struct.unpack_from('<HH', data, 6)
+        return None
+    if image_format == 'webp':
+        return _parse_webp_dims(data)
+    return None
+
+
+def _pil_dims(data: bytes) -> Tuple[int, int]:
+    """
+    PIL でヘッダーのみを読み込んで寸法を取得（load() は呼ばず、ピクセルはデコードしない）
+    
+    draft() は JPEG の size を縮小後の値に書き換えるため使用しない。
+    bytes から作った BytesIO はバッファをコピーせずに共有するため、
+    再利用バッファへの write() より安価。
+    
+    Args:
+        data: 画像のバイナリデータ
+        
+    Returns:
+        (width, height) のタプル（解析できない場合は例外を送出）
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        return img.size
+
+
+# S3クライアント設定（一括分析のワーカー数に合わせたコネクションプール）
+_S3_CLIENT_CONFIG = Config(
+    max_pool_connections=BATCH_MAX_WORKERS,
+    retries={'mode': 'adaptive'}
+)
+
+# boto3 のデフォルトセッションはスレッドセーフではないため、クライアント生成を直列化する
+_s3_client_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=8)
+def _make_s3_client(aws_region: str, aws_access_key: Optional[str] = None,
+                    aws_secret_key: Optional[str] = None):
+    """
+    S3クライアントを生成（リージョン・認証情報ごとにキャッシュし、インスタンス間で共有）
+    
+    Args:
+        aws_region: AWS Region
+        aws_access_key: AWS Access Key ID
+        aws_secret_key: AWS Secret Access Key
+        
+    Returns:
+        S3クライアント
+    """
+    if aws_access_key and aws_secret_key:
+        return boto3.client(
+            's3',
+            aws_access_key_id=aws_access_key,
+            aws_secret_access_key=aws_secret_key,
+            region_name=aws_region,
+            config=_S3_CLIENT_CONFIG
+        )
+    # 環境変数またはIAMロールから認証情報を取得
+    return boto3.client('s3', region_name=aws_region, config=_S3_CLIENT_CONFIG)
+
+
+def _get_s3_client(aws_region: str, aws_access_key: Optional[str] = None,
+                   aws_secret_key: Optional[str] = None) -> Any:
+    """キャッシュ済みのS3クライアントを取得（複数スレッドから同時に呼ばれても生成は1回のみ）"""
+    with _s3_client_lock:
+        return _make_s3_client(aws_region, aws_access_key, aws_secret_key)
+
+
+# 寸法検出ストラテジーの結果: (width, height, 検出方法)
+Detection = Tuple[int, int, str]
+
+
+@dataclass(slots=True)
+class _DetectionContext:
+    """寸法検出ストラテジー間で共有する入力と、遅延取得する S3 メタデータ"""
+    bucket_name: str
+    file_key: str
+    explicit_width: Optional[int] = None
+    explicit_height: Optional[int] = None
+    metadata: Optional[Dict[str, Any]] = None
+    metadata_fetched: bool = False
+
+
+@dataclass(slots=True)
+class AnalysisResult:
+    """画像の分析結果（辞書への変換は to_dict() で出力時にのみ行う）"""
+    success: bool
+    bucket: str
+    key: str
+    analyzed_at: str
+    classification: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    aspect_ratio: Optional[float] = None
+    detail_classification: Optional[str] = None
+    recommendation_key: Optional[str] = None
+    is_tall: bool = False
+    detection_method: str = _DET_UNKNOWN
+    error: Optional[str] = None
+    error_type: Optional[str] = None
+    
+    @property
+    def recommended_action(self) -> Optional[str]:
+        """推奨アクション（recommendation_key を文字列に展開）"""
+        return _RECS[self.recommendation_key] if self.recommendation_key else None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        JSON出力用の辞書に変換
+        
+        Returns:
+            分析結果の辞書（成功時・寸法不正時・例外発生時でそれぞれの形式）
+        """
+        s3_source = {
+            'bucket': self.bucket,
+            'key': self.key
+        }
+        
+        if self.success:
+            aspect_ratio = cast(float, self.aspect_ratio)
+            return {
+                'success': True,
+                'width': self.width,
+                'height': self.height,
+                'aspect_ratio': aspect_ratio,
+                'decimal_ratio': round(aspect_ratio, 2),
+                'classification': self.classification,
+                'detail_classification': self.detail_classification,
+                'recommended_action': self.recommended_action,
+                'ratio_text': f"{self.width}:{self.height}",
+                'is_tall': self.is_tall,
+                'ratio_2_3_comparison': {
+                    'threshold': round(THRESHOLD_2_3, 2),
+                    'is_taller_than_2_3': self.is_tall,
+                    'difference_from_2_3': round(aspect_ratio - THRESHOLD_2_3, 2)
+                },
+                'detection_method': self.detection_method,
+                's3_source': s3_source,
+                'analyzed_at': self.analyzed_at
+            }
+        
+        if self.error_type:
+            return {
+                'success': False,
+                'error': self.error,
+                'error_type': self.error_type,
+                'classification': self.classification,
+                's3_source': s3_source,
+                'analyzed_at': self.analyzed_at
+            }
+        
+        return {
+            'success': False,
+            'error': self.error,
+            'classification': self.classification,
+            'debug_info': {
+                'detected_width': self.width,
+                'detected_height': self.height,
+                'detection_method': self.detection_method
+            },
+            's3_source': s3_source,
+            'analyzed_at': self.analyzed_at
+        }
 
 
 class ImageAspectAnalyzer:
     """画像アスペクト比分析クラス"""
     
-    def __init__(self, aws_access_key: str = None, aws_secret_key: str = None, aws_region: str = 'ap-northeast-1'):
+    def __init__(self, aws_access_key: Optional[str] = None, aws_secret_key: Optional[str] = None,
+                 aws_region: str = 'ap-northeast-1'):
         """
         初期化
         
@@ -29,19 +390,28 @@ class ImageAspectAnalyzer:
             aws_secret_key: AWS Secret Access Key  
             aws_region: AWS Region
         """
-        self.threshold_2_3 = 2/3  # 0.6667
+        self.threshold_2_3 = THRESHOLD_2_3
         
-        # S3クライアントの初期化
-        if aws_access_key and aws_secret_key:
-            self.s3_client = boto3.client(
-                's3',
-                aws_access_key_id=aws_access_key,
-                aws_secret_access_key=aws_secret_key,
-                region_name=aws_region
-            )
-        else:
-            # 環境変数またはIAMロールから認証情報を取得
-            self.s3_client = boto3.client('s3', region_name=aws_region)
+        # S3クライアントは初回アクセス時に生成（明示的な寸法指定のみの場合は生成しない）
+        self._aws_access_key = aws_access_key
+        self._aws_secret_key = aws_secret_key
+        self._aws_region = aws_region
+        
+        # 寸法検出ストラテジー（安価な順、最初に結果を返したものを採用）
+        # ファイル名の寸法表記はS3アクセスより先に、キーワード推測は実画像の解析より後に評価する
+        self._strategies: Tuple[Callable[[_DetectionContext], Optional[Detection]], ...] = (
+            self._detect_explicit,
+            self._detect_filename_pattern,
+            self._detect_header_range_s3,
+            self._detect_filename_keywords,
+            self._detect_head_object_size,
+            self._detect_default,
+        )
+    
+    @functools.cached_property
+    def s3_client(self) -> Any:
+        """S3クライアント（同じ設定のインスタンス間で再利用）"""
+        return _get_s3_client(self._aws_region, self._aws_access_key, self._aws_secret_key)
     
     def download_image_from_s3(self, bucket_name: str, file_key: str) -> Optional[bytes]:
         """
@@ -55,13 +425,142 @@ class ImageAspectAnalyzer:
             画像のバイナリデータ、失敗時はNone
         """
         try:
-            print(f"Downloading image from S3: s3://{bucket_name}/{file_key}")
+            logger.debug("Downloading image from S3: s3://%s/%s", bucket_name, file_key)
             response = self.s3_client.get_object(Bucket=bucket_name, Key=file_key)
             return response['Body'].read()
         except Exception as e:
-            print(f"Error downloading from S3: {str(e)}")
+            logger.warning("Error downloading from S3: %s", e)
             return None
     
+    def get_object_metadata(self, bucket_name: str, file_key: str) -> Optional[Dict[str, Any]]:
+        """
+        S3オブジェクトのメタデータを head_object で取得（本体はダウンロードしない）
+        
+        Args:
+            bucket_name: S3バケット名
+            file_key: S3オブジェクトキー
+            
+        Returns:
+            head_object のレスポンス（ContentLength, ETag など）、失敗時はNone
+        """
+        try:
+            return self.s3_client.head_object(Bucket=bucket_name, Key=file_key)
+        except Exception as e:
+            logger.warning("Error getting object metadata from S3: %s", e)
+            return None
+    
+    def _stream_header(self, bucket_name: str, file_key: str,
+                       if_none_match: Optional[str] = None) -> Tuple[Optional[Tuple[int, int]], Optional[str], bool]:
+        """
+        S3オブジェクトの先頭を少しずつ読み込みながら寸法を解析し、判明した時点で読み込みを終える
+        
+        まず先頭 HEADER_RANGE_BYTES を取得し、ヘッダーが見つからない場合のみ
+        HEADER_MAX_RANGE_BYTES までの続きを取得する。
+        
+        Args:
+            bucket_name: S3バケット名
+            file_key: S3オブジェクトキー
+            if_none_match: キャッシュ済みの ETag（一致した場合は 304 となり本体を取得しない）
+            
+        Returns:
+            (寸法またはNone, レスポンスの ETag, 304 Not Modified だったか) のタプル
+        """
+        header_data = bytearray()
+        etag: Optional[str] = None
+        
+        for start, end in ((0, HEADER_RANGE_BYTES), (HEADER_RANGE_BYTES, HEADER_MAX_RANGE_BYTES)):
+            params: Dict[str, Any] = {'Bucket': bucket_name, 'Key': file_key, 'Range': f"bytes={start}-{end - 1}"}
+            if start == 0:
+                if if_none_match:
+                    params['IfNoneMatch'] = if_none_match
+            elif etag:
+                # 1回目と2回目の間にオブジェクトが置き換えられた場合は失敗させる
+                params['IfMatch'] = etag
+            try:
+                logger.debug("Streaming image header from S3: s3://%s/%s (bytes=%s-%s)", bucket_name, file_key, start, end - 1)
+                response = self.s3_client.get_object(**params)
+            except ClientError as e:
+                if e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 304:
+                    return None, if_none_match, True
+                logger.warning("Error downloading header from S3: %s", e)
+                return None, etag, False
+            except Exception as e:
+                logger.warning("Error downloading header from S3: %s", e)
+                return None, etag, False
+            
+            etag = etag or response.get('ETag')
+            body = response['Body']
+            range_read = 0
+            try:
+                while True:
+                    chunk = body.read(STREAM_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    range_read += len(chunk)
+                    header_data += chunk
+                    
+                    dimensions = _parse_dims(header_data)
+                    if dimensions:
+                        width, height = dimensions
+                        logger.debug("Detected image dimensions from header stream: %sx%s (%s bytes read)",
+                                     width, height, len(header_data))
+                        return (width, height), etag, False
+            except Exception as e:
+                logger.warning("Error streaming header from S3: %s", e)
+                return None, etag, False
+            finally:
+                # 残りが少なければ読み切って接続をプールに戻し、多ければ接続ごと打ち切る
+                # （最初の HEADER_RANGE_BYTES の範囲は常に読み切られる）
+                try:
+                    if response.get('ContentLength', end - start) - range_read <= STREAM_DRAIN_BYTES:
+                        body.read()
+                except Exception:
+                    pass
+                body.close()
+            
+            # _parse_dims が対応しない形式は範囲ごとに PIL でヘッダーのみを解析（失敗した場合は続きを取得）
+            if _image_format(header_data) is None:
+                try:
+                    width, height = _pil_dims(bytes(header_data))
+                except Exception as e:
+                    logger.debug("Image header incomplete or unsupported, more bytes required: %s", e)
+                else:
+                    logger.debug("Detected image dimensions from header stream: %sx%s (%s bytes read)",
+                                 width, height, len(header_data))
+                    return (width, height), etag, False
+            
+            # オブジェクトの末尾まで読み込んだ場合は続きを取得しない
+            content_range = response.get('ContentRange', '')
+            if len(header_data) < end or content_range.endswith(f"/{len(header_data)}"):
+                break
+        
+        logger.debug("Image header not found in first %s bytes", len(header_data))
+        return None, etag, False
+    
+    def detect_dimensions_cached(self, bucket_name: str, file_key: str) -> Optional[Tuple[int, int]]:
+        """
+        キャッシュ済みの ETag を If-None-Match に指定してヘッダーを取得し、
+        304 が返った場合はキャッシュの寸法を使用する（HEAD リクエストは行わない）
+        
+        Args:
+            bucket_name: S3バケット名
+            file_key: S3オブジェクトキー
+            
+        Returns:
+            (width, height) のタプル、取得できない場合はNone
+        """
+        cached = _get_cached_dimensions(bucket_name, file_key)
+        cached_etag = cached[0] if cached else None
+        
+        dimensions, etag, not_modified = self._stream_header(bucket_name, file_key, cached_etag)
+        if not_modified and cached:
+            logger.debug("Using cached dimensions for ETag %s: %sx%s", cached_etag, cached[1][0], cached[1][1])
+            return cached[1]
+        
+        if dimensions and etag:
+            _set_cached_dimensions(bucket_name, file_key, etag, dimensions)
+        return dimensions
+    
     def get_image_dimensions_from_binary(self, image_data: bytes) -> Optional[Tuple[int, int]]:
         """
         バイナリデータから画像の寸法を取得
@@ -72,14 +571,20 @@ class ImageAspectAnalyzer:
         Returns:
             (width, height) のタプル、失敗時はNone
         """
+        dimensions = _parse_dims(image_data)
+        if dimensions:
+            width, height = dimensions
+            logger.debug("Detected image dimensions from binary data: %sx%s", width, height)
+            return width, height
+        
         try:
-            with Image.open(io.BytesIO(image_data)) as img:
-                width, height = img.size
-                print(f"Detected image dimensions from binary data: {width}x{height}")
-                return width, height
+            width, height = _pil_dims(image_data)
         except Exception as e:
-            print(f"Error getting dimensions from binary data: {str(e)}")
+            logger.warning("Error getting dimensions from binary data: %s", e)
             return None
+        
+        logger.debug("Detected image dimensions from binary data: %sx%s", width, height)
+        return width, height
     
     def detect_dimensions_from_filename(self, filename: str) -> Optional[Tuple[int, int]]:
         """
@@ -91,32 +596,51 @@ class ImageAspectAnalyzer:
         Returns:
             (width, height) のタプル、推測できない場合はNone
         """
+        return (self.detect_dimensions_from_filename_pattern(filename)
+                or self.detect_dimensions_from_filename_keywords(filename))
+    
+    def detect_dimensions_from_filename_pattern(self, filename: str) -> Optional[Tuple[int, int]]:
+        """
+        ファイル名に含まれる 1920x1080 形式の寸法を取得
+        
+        Args:
+            filename: ファイル名
+            
+        Returns:
+            (width, height) のタプル、含まれない場合はNone
+        """
         if not filename:
             return None
         
-        # パターン1: 1920x1080 形式
-        dimension_match = re.search(r'(\d+)x(\d+)', filename, re.IGNORECASE)
+        dimension_match = _DIM_RE.search(filename)
         if dimension_match:
             width = int(dimension_match.group(1))
             height = int(dimension_match.group(2))
-            print(f"Found dimensions in filename: {width}x{height}")
+            logger.debug("Found dimensions in filename: %sx%s", width, height)
             return width, height
         
-        # パターン2: キーワードベースの推測
-        lower_filename = filename.lower()
-        print(f"Using keyword-based detection for: {lower_filename}")
+        return None
+    
+    def detect_dimensions_from_filename_keywords(self, filename: str) -> Optional[Tuple[int, int]]:
+        """
+        ファイル名のキーワード（banner, portrait, icon など）から寸法を推測
         
-        if any(keyword in lower_filename for keyword in ['banner', 'header', 'landscape', 'wide']):
-            width, height = 1920, 1080  # 横長デフォルト
-            print(f"Detected wide image keyword, using: {width}x{height}")
-            return width, height
-        elif any(keyword in lower_filename for keyword in ['portrait', 'mobile', 'vertical', 'tall']):
-            width, height = 1080, 1920  # 縦長デフォルト
-            print(f"Detected tall image keyword, using: {width}x{height}")
-            return width, height
-        elif any(keyword in lower_filename for keyword in ['square', 'icon', 'profile', 'avatar']):
-            width, height = 500, 500  # 正方形デフォルト
-            print(f"Detected square image keyword, using: {width}x{height}")
+        Args:
+            filename: ファイル名
+            
+        Returns:
+            (width, height) のタプル、推測できない場合はNone
+        """
+        if not filename:
+            return None
+        
+        logger.debug("Using keyword-based detection for: %s", filename)
+        
+        # 1回の走査で全キーワードを検出し、複数該当時は分類の優先順で決定
+        matches = [_KW_MAP[match.group(1).lower()] for match in _KW_RE.finditer(filename)]
+        if matches:
+            _, label, (width, height) = min(matches)
+            logger.debug("Detected %s image keyword, using: %sx%s", label, width, height)
             return width, height
         
         return None
@@ -137,8 +661,19 @@ class ImageAspectAnalyzer:
         if not isinstance(size_input, str):
             return 0
         
-        # '1.06 MB' のような文字列を数値に変換
-        size_match = re.search(r'([\d.]+)\s*(MB|KB|B)', size_input, re.IGNORECASE)
+        # '1.06 MB' のような文字列を末尾の単位で判定して数値に変換
+        size_str = size_input.strip().upper()
+        multiplier = _SIZE_UNITS.get(size_str[-2:])
+        if multiplier:
+            size_number = size_str[:-2].rstrip()
+        elif size_str.endswith('B'):
+            multiplier = 1
+            size_number = size_str[:-1].rstrip()
+        if multiplier and size_number.replace('.', '', 1).isdecimal():
+            return int(float(size_number) * multiplier)
+        
+        # 上記の形式に当てはまらない文字列は正規表現で数値と単位を抽出
+        size_match = _SIZE_RE.search(size_input)
         if size_match:
             size_value = float(size_match.group(1))
             size_unit = size_match.group(2).upper()
@@ -165,7 +700,7 @@ class ImageAspectAnalyzer:
         Returns:
             (width, height) のタプル
         """
-        print(f"Using file size estimation, size: {file_size}")
+        logger.debug("Using file size estimation, size: %s", file_size)
         
         if file_size > 2000000:  # 2MB以上 → 高解像度横長
             width, height = 1920, 1080
@@ -176,7 +711,7 @@ class ImageAspectAnalyzer:
         else:  # 小さいファイル → 正方形と仮定
             width, height = 500, 500
         
-        print(f"File size based estimation: {width}x{height}")
+        logger.debug("File size based estimation: %sx%s", width, height)
         return width, height
     
     def classify_aspect_ratio(self, aspect_ratio: float) -> str:
@@ -190,31 +725,101 @@ class ImageAspectAnalyzer:
             分類結果 ('tall' または 'not_tall')
         """
         if aspect_ratio < self.threshold_2_3:
-            return 'tall'  # 縦長（2:3より縦長）
+            return _CLASS_TALL  # 縦長（2:3より縦長）
         else:
-            return 'not_tall'  # 縦長でない（2:3以上の比率）
+            return _CLASS_NOT_TALL  # 縦長でない（2:3以上の比率）
+    
+    def classify_dimensions(self, width: int, height: int) -> str:
+        """
+        寸法からアスペクト比を分類（整数比較のみで判定）
+        
+        Args:
+            width: 幅
+            height: 高さ
+            
+        Returns:
+            分類結果 ('tall' または 'not_tall')
+        """
+        # width / height < 2/3 と等価
+        if 3 * width < 2 * height:
+            return _CLASS_TALL  # 縦長（2:3より縦長）
+        else:
+            return _CLASS_NOT_TALL  # 縦長でない（2:3以上の比率）
     
     def get_detailed_classification(self, aspect_ratio: float) -> Tuple[str, str]:
         """
-        詳細な分類と推奨アクションを取得
+        詳細な分類と推奨アクションのキーを取得
         
         Args:
             aspect_ratio: アスペクト比
             
         Returns:
-            (詳細分類, 推奨アクション) のタプル
-        """
-        if aspect_ratio < 0.67:
-            return ('縦長（2:3より縦長）', 'ポートレート写真、モバイル向け画像、縦型バナーとして使用')
-        elif 0.67 <= aspect_ratio < 0.8:
-            return ('2:3から3:4の範囲', 'ポートレート写真や縦型コンテンツに適用')
-        elif 0.8 <= aspect_ratio < 1.2:
-            return ('正方形に近い', 'プロフィール画像、アイコン、正方形コンテンツに適用')
-        else:
-            return ('横長', 'バナー画像、ヘッダー画像、横型コンテンツに適用')
+            (詳細分類, 推奨アクションのキー) のタプル（キーは _RECS で文字列に展開）
+        """
+        # < 0.67, 0.67-0.8, 0.8-1.2, >= 1.2 の各区間（下限を含む）
+        return _BUCKETS[bisect.bisect_right(_THRESHOLDS, aspect_ratio)]
+    
+    def _get_context_metadata(self, context: _DetectionContext) -> Optional[Dict[str, Any]]:
+        """head_object のレスポンスを初回のみ取得（画像以外の拡張子のキーは取得しない、ファイルサイズからの推測でのみ使用）"""
+        if not context.metadata_fetched:
+            if _looks_like_image(context.file_key):
+                context.metadata = self.get_object_metadata(context.bucket_name, context.file_key)
+            context.metadata_fetched = True
+        return context.metadata
+    
+    def _detect_explicit(self, context: _DetectionContext) -> Optional[Detection]:
+        """1. 明示的な寸法指定"""
+        if context.explicit_width and context.explicit_height:
+            width = int(context.explicit_width)
+            height = int(context.explicit_height)
+            logger.debug("Using explicit dimensions: %sx%s", width, height)
+            return width, height, _DET_EXPLICIT
+        return None
+    
+    def _detect_filename_pattern(self, context: _DetectionContext) -> Optional[Detection]:
+        """2. ファイル名の 1920x1080 形式の寸法（S3にアクセスしない）"""
+        dimensions = self.detect_dimensions_from_filename_pattern(context.file_key)
+        # 0x1f のような寸法ではない表記は採用せず、後続のストラテジーに委ねる
+        if dimensions and dimensions[0] > 0 and dimensions[1] > 0:
+            return dimensions[0], dimensions[1], _DET_FILENAME
+        return None
+    
+    def _detect_header_range_s3(self, context: _DetectionContext) -> Optional[Detection]:
+        """3. S3から画像ヘッダーのみを取得して実際の寸法を解析（ETagで条件付きリクエスト）"""
+        # 画像以外の拡張子のキーはS3にアクセスしない
+        if not _looks_like_image(context.file_key):
+            logger.debug("Skipping S3 access for non-image key: %s", context.file_key)
+            return None
+        
+        dimensions = self.detect_dimensions_cached(context.bucket_name, context.file_key)
+        if dimensions:
+            return dimensions[0], dimensions[1], _DET_BINARY
+        return None
+    
+    def _detect_filename_keywords(self, context: _DetectionContext) -> Optional[Detection]:
+        """4. ファイル名のキーワードから推測"""
+        dimensions = self.detect_dimensions_from_filename_keywords(context.file_key)
+        if dimensions:
+            return dimensions[0], dimensions[1], _DET_FILENAME
+        return None
+    
+    def _detect_head_object_size(self, context: _DetectionContext) -> Optional[Detection]:
+        """5. オブジェクトサイズから推測"""
+        metadata = self._get_context_metadata(context)
+        if metadata is None:
+            return None
+        width, height = self.detect_dimensions_from_filesize(metadata['ContentLength'])
+        return width, height, _DET_FILESIZE
+    
+    def _detect_default(self, context: _DetectionContext) -> Optional[Detection]:
+        """6. デフォルト値"""
+        width, height = 800, 600
+        logger.debug("Using default dimensions: %sx%s", width, height)
+        return width, height, _DET_DEFAULT
     
     def analyze_image(self, bucket_name: str, file_key: str, 
-                     explicit_width: int = None, explicit_height: int = None) -> Dict[str, Any]:
+                     explicit_width: Optional[int] = None, explicit_height: Optional[int] = None,
+                     analyzed_at: Optional[str] = None) -> AnalysisResult:
         """
         画像を分析してアスペクト比と分類を返す
         
@@ -223,116 +828,106 @@ class ImageAspectAnalyzer:
             file_key: S3オブジェクトキー
             explicit_width: 明示的に指定された幅
             explicit_height: 明示的に指定された高さ
+            analyzed_at: 分析日時（ISO形式、省略時は現在時刻）
             
         Returns:
-            分析結果の辞書
+            分析結果
         """
+        if analyzed_at is None:
+            analyzed_at = datetime.now().isoformat()
+        
         try:
-            print(f"Analyzing image: s3://{bucket_name}/{file_key}")
-            
-            width = None
-            height = None
-            detection_method = 'unknown'
+            logger.debug("Analyzing image: s3://%s/%s", bucket_name, file_key)
             
-            # 1. 明示的な寸法指定を優先
-            if explicit_width and explicit_height:
-                width = int(explicit_width)
-                height = int(explicit_height)
-                detection_method = 'explicit'
-                print(f"Using explicit dimensions: {width}x{height}")
-            else:
-                # 2. S3から画像をダウンロードして実際の寸法を取得
-                image_data = self.download_image_from_s3(bucket_name, file_key)
-                if image_data:
-                    dimensions = self.get_image_dimensions_from_binary(image_data)
-                    if dimensions:
-                        width, height = dimensions
-                        detection_method = 'binary_analysis'
-                    else:
-                        # 3. ファイル名から推測
-                        dimensions = self.detect_dimensions_from_filename(file_key)
-                        if dimensions:
-                            width, height = dimensions
-                            detection_method = 'filename_pattern'
-                        else:
-                            # 4. ファイルサイズから推測
-                            file_size = len(image_data)
-                            width, height = self.detect_dimensions_from_filesize(file_size)
-                            detection_method = 'filesize_estimation'
-                else:
-                    # S3からのダウンロードに失敗した場合
-                    dimensions = self.detect_dimensions_from_filename(file_key)
-                    if dimensions:
-                        width, height = dimensions
-                        detection_method = 'filename_pattern'
-                    else:
-                        # デフォルト値
-                        width, height = 800, 600
-                        detection_method = 'default'
-                        print(f"Using default dimensions: {width}x{height}")
+            context = _DetectionContext(bucket_name, file_key, explicit_width, explicit_height)
+            width, height, detection_method = None, None, _DET_UNKNOWN
+            for strategy in self._strategies:
+                detection = strategy(context)
+                if detection:
+                    width, height, detection_method = detection
+                    break
             
             # 寸法の妥当性チェック
             if width and height and width > 0 and height > 0:
+                # 分類は整数比較で判定し、浮動小数点のアスペクト比は出力項目にのみ使用
+                classification = self.classify_dimensions(width, height)
+                is_tall = classification == _CLASS_TALL
                 aspect_ratio = width / height
-                classification = self.classify_aspect_ratio(aspect_ratio)
-                detail_classification, recommendation = self.get_detailed_classification(aspect_ratio)
-                
-                result = {
-                    'success': True,
-                    'width': width,
-                    'height': height,
-                    'aspect_ratio': aspect_ratio,
-                    'decimal_ratio': round(aspect_ratio, 2),
-                    'classification': classification,
-                    'detail_classification': detail_classification,
-                    'recommended_action': recommendation,
-                    'ratio_text': f"{width}:{height}",
-                    'is_tall': aspect_ratio < self.threshold_2_3,
-                    'ratio_2_3_comparison': {
-                        'threshold': round(self.threshold_2_3, 2),
-                        'is_taller_than_2_3': aspect_ratio < self.threshold_2_3,
-                        'difference_from_2_3': round(aspect_ratio - self.threshold_2_3, 2)
-                    },
-                    'detection_method': detection_method,
-                    's3_source': {
-                        'bucket': bucket_name,
-                        'key': file_key
-                    },
-                    'analyzed_at': datetime.now().isoformat()
-                }
+                detail_classification, recommendation_key = self.get_detailed_classification(aspect_ratio)
                 
-                print(f"Analysis successful: {width}x{height}, aspect_ratio: {aspect_ratio:.2f}, classification: {classification}")
-                return result
+                logger.debug("Analysis successful: %sx%s, aspect_ratio: %.2f, classification: %s", width, height, aspect_ratio, classification)
+                return AnalysisResult(
+                    success=True,
+                    bucket=bucket_name,
+                    key=file_key,
+                    analyzed_at=analyzed_at,
+                    classification=classification,
+                    width=width,
+                    height=height,
+                    aspect_ratio=aspect_ratio,
+                    detail_classification=detail_classification,
+                    recommendation_key=recommendation_key,
+                    is_tall=is_tall,
+                    detection_method=detection_method
+                )
             else:
-                return {
-                    'success': False,
-                    'error': f'Invalid dimensions detected: width={width}, height={height}',
-                    'classification': 'unknown',
-                    'debug_info': {
-                        'detected_width': width,
-                        'detected_height': height,
-                        'detection_method': detection_method
-                    },
-                    's3_source': {
-                        'bucket': bucket_name,
-                        'key': file_key
-                    },
-                    'analyzed_at': datetime.now().isoformat()
-                }
+                return AnalysisResult(
+                    success=False,
+                    bucket=bucket_name,
+                    key=file_key,
+                    analyzed_at=analyzed_at,
+                    classification=_CLASS_UNKNOWN,
+                    width=width,
+                    height=height,
+                    detection_method=detection_method,
+                    error=f'Invalid dimensions detected: width={width}, height={height}'
+                )
                 
         except Exception as e:
-            print(f"Analysis error: {str(e)}")
-            return {
-                'success': False,
-                'error': f'Analysis error: {str(e)}',
-                'error_type': type(e).__name__,
-                'classification': 'error',
-                's3_source': {
-                    'bucket': bucket_name,
-                    'key': file_key
-                },
-                'analyzed_at': datetime.now().isoformat()
+            logger.warning("Analysis error: %s", e)
+            return AnalysisResult(
+                success=False,
+                bucket=bucket_name,
+                key=file_key,
+                analyzed_at=analyzed_at,
+                classification=_CLASS_ERROR,
+                error=f'Analysis error: {str(e)}',
+                error_type=type(e).__name__
+            )
+    
+    def analyze_images(self, bucket_name: str, file_keys: Iterable[str],
+                       max_workers: int = BATCH_MAX_WORKERS) -> Iterator[Tuple[str, AnalysisResult]]:
+        """
+        複数の画像を並列に分析し、完了した順に結果を返す
+        
+        S3クライアントはスレッドセーフなため、全ワーカーで同じクライアント
+        （BATCH_MAX_WORKERS 本のコネクションプール）を共有する。
+        
+        Args:
+            bucket_name: S3バケット名
+            file_keys: S3オブジェクトキーのリスト
+            max_workers: 同時リクエスト数
+            
+        Yields:
+            (S3オブジェクトキー, 分析結果) のタプル
+        """
+        # 分析日時はバッチ全体で共通の値を使用
+        analyzed_at = datetime.now().isoformat()
+        
+        # ワーカースレッド内で同時に生成されないよう、S3クライアントを事前に生成しておく
+        _ = self.s3_client
+        
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {
+                executor.submit(self.analyze_image, bucket_name, file_key, analyzed_at=analyzed_at): file_key
+                for file_key in file_keys
             }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # 呼び出し側が途中で反復をやめた場合は未着手の分析を取り消し、実行中のもののみ待つ
+            executor.shutdown(cancel_futures=True)
 
 
 def main():
@@ -346,8 +941,12 @@ def main():
     parser.add_argument('--aws-secret-key', help='AWS Secret Access Key')
     parser.add_argument('--aws-region', default='ap-northeast-1', help='AWS Region')
     parser.add_argument('--output', choices=['json', 'human'], default='human', help='出力形式')
+    parser.add_argument('--verbose', action='store_true', help='詳細ログを標準エラー出力に表示')
     
     args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
     
     try:
         # アナライザーの初期化
@@ -367,23 +966,23 @@ def main():
         
         # 結果出力
         if args.output == 'json':
-            print(json.dumps(result, indent=2, ensure_ascii=False))
+            print(json.dumps(result.to_dict(), indent=2, ensure_ascii=False))
         else:
             # 人間が読みやすい形式
-            if result['success']:
+            if result.success:
                 print(f"✅ 分析成功")
-                print(f"📐 寸法: {result['width']}x{result['height']}")
-                print(f"📊 アスペクト比: {result['decimal_ratio']}")
-                print(f"🏷️  分類: {result['detail_classification']}")
-                print(f"💡 推奨: {result['recommended_action']}")
-                print(f"🔍 検出方法: {result['detection_method']}")
+                print(f"📐 寸法: {result.width}x{result.height}")
+                print(f"📊 アスペクト比: {round(result.aspect_ratio, 2)}")
+                print(f"🏷️  分類: {result.detail_classification}")
+                print(f"💡 推奨: {result.recommended_action}")
+                print(f"🔍 検出方法: {result.detection_method}")
                 
-                if result['classification'] == 'tall':
+                if result.is_tall:
                     print(f"📱 結果: 縦長画像（2:3より縦長）")
                 else:
                     print(f"🖥️  結果: 縦長でない画像（2:3以上）")
             else:
-                print(f"❌ 分析失敗: {result['error']}")
+                print(f"❌ 分析失敗: {result.error}")
                 
     except Exception as e:
         print(f"❌ エラー: {str(e)}")
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+image_aspect_analyzer.py を mypyc でネイティブ拡張にコンパイルするビルドスクリプト（任意）
+
+分類・ファイル名解析・ヘッダー解析などの処理が C レベルで実行されるため、
+analyze_images による大量処理が高速化される。
+
+使用方法:
+    pip install mypy boto3 Pillow
+    python setup.py build_ext --inplace
+
+ビルド後は同じディレクトリの拡張モジュールが .py より優先してインポートされる。
+コンパイル版を使わない場合は生成された .so / .pyd ファイルを削除する。
+"""
+
+from setuptools import setup
+from mypyc.build import mypycify
+
+
+setup(
+    name='image-aspect-analyzer',
+    ext_modules=mypycify([
+        '--ignore-missing-imports',  # boto3 / botocore は型情報を持たない
+        'image_aspect_analyzer.py',
+    ]),
+)